@@ -1,26 +1,99 @@
-from fastapi import APIRouter, HTTPException, Query, Path
-from datetime import datetime, timedelta
-from typing import Dict
-from apps.schemas import PricesResponse, DayPrices
+from fastapi import APIRouter, HTTPException, Query, Path, Request
+from datetime import date, datetime, timedelta
+from typing import Dict, Literal, Optional, Tuple
+from apps.schemas import PricesResponse, DayPrices, HourlyPrice
 from apps.services.prices import PriceService, PriceServiceError
 from config import settings
-import io
-import csv
-from fastapi.responses import StreamingResponse
+import asyncio
+import ormsgpack
+import time
+from fastapi.responses import Response, StreamingResponse
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/prices", tags=["prices"])
 
+# Short-lived cache of fully built responses so the JSON view and the CSV
+# export triggered right after it share one fetch + grid build per date.
+# Per-key locks keep concurrent cold requests from racing the same build.
+# Bounded: expired entries are swept on insert and the oldest evicted beyond
+# the cap, so a scan over the valid date range can't pin dead responses
+# (each entry holds ~73 models) for the process lifetime.
+_RESPONSE_TTL = 60.0
+_RESPONSE_CACHE_MAX = 16
+_response_cache: Dict[Tuple[date, bool], Tuple[float, PricesResponse, Dict, Dict]] = {}
+_response_locks: Dict[Tuple[date, bool], asyncio.Lock] = {}
+
+
+async def _build_response(
+    service: PriceService,
+    selected_date: date,
+    include_metadata: bool
+) -> Tuple[PricesResponse, Dict, Dict]:
+    """Fetch market data and build the 3-day response, with a TTL cache
+    shared by the JSON and CSV endpoints.
+
+    Returns (response, dates, expected_hour_counts)."""
+    key = (selected_date, include_metadata)
+
+    cached = _response_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < _RESPONSE_TTL:
+        return cached[1], cached[2], cached[3]
+
+    lock = _response_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        # Re-check: another request may have built it while we waited
+        cached = _response_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < _RESPONSE_TTL:
+            return cached[1], cached[2], cached[3]
+
+        date_range = _calculate_date_range(selected_date)
+
+        raw_data = await service.fetch_market_data(
+            date_range["start_ts"],
+            date_range["end_ts"]
+        )
+
+        logger.info("Fetched %d data points for date range", len(raw_data))
+
+        result, expected_counts = await _process_three_days(
+            service,
+            date_range["dates"],
+            raw_data,
+            include_metadata
+        )
+
+        now = time.monotonic()
+        _response_cache[key] = (now, result, date_range["dates"], expected_counts)
+
+        # Sweep expired entries, then evict oldest-inserted past the cap
+        # (dicts iterate in insertion order)
+        for stale in [k for k, v in _response_cache.items() if now - v[0] >= _RESPONSE_TTL]:
+            del _response_cache[stale]
+        while len(_response_cache) > _RESPONSE_CACHE_MAX:
+            del _response_cache[next(iter(_response_cache))]
+
+    # The entry is cached now; the lock has done its job and late waiters
+    # hit the cache check above, so don't keep one Lock per key forever
+    _response_locks.pop(key, None)
+    return result, date_range["dates"], expected_counts
+
+
+def _shared_http_client(request: Request):
+    """App-lifetime httpx client created on startup (see main.py)"""
+    return getattr(request.app.state, "http_client", None)
+
 @router.get("/{date}", response_model=PricesResponse)
 async def get_prices(
+    request: Request,
     date: str = Path(
         ...,
         description="Date in YYYY-MM-DD format",
         pattern=r"^\d{4}-\d{2}-\d{2}$"
     ),
-    include_metadata: bool = Query(False, description="Include additional metadata")
+    include_metadata: bool = Query(False, description="Include additional metadata"),
+    format: Literal["json", "msgpack"] = Query("json", description="Response encoding")
 ):
     """
     Retrieve electricity prices for selected date and surrounding days.
@@ -31,52 +104,86 @@ async def get_prices(
     - Timezone conversions (UTC → Europe/Vienna)
     - Unit conversions (EUR/MWh → ct/kWh)
     """
-    service = PriceService()
-    
+    service = PriceService(_shared_http_client(request))
+
     try:
         # Validate and parse date
         selected_date = _validate_date(date)
-        
-        # Calculate date range
-        date_range = _calculate_date_range(selected_date)
-        
-        # Fetch data from API
-        raw_data = await service.fetch_market_data(
-            date_range["start_ts"],
-            date_range["end_ts"]
-        )
-        
-        logger.info(f"Fetched {len(raw_data)} data points for date range")
-        
-        # Process data for each day
-        result = await _process_three_days(
-            service, 
-            date_range["dates"], 
-            raw_data,
-            include_metadata
+
+        # Fetch and process (cached across JSON/CSV calls for the same date)
+        result, dates, expected_counts = await _build_response(
+            service, selected_date, include_metadata
         )
-        
+
         # Validate hour counts
-        _validate_hour_counts(result, date_range["dates"])
-        
+        _validate_hour_counts(result, dates, expected_counts)
+
+        if format == "msgpack":
+            return _msgpack_response(result)
+
         return result
-        
+
     except PriceServiceError as e:
         raise HTTPException(status_code=502, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Unexpected error processing prices: {str(e)}", exc_info=True)
+        logger.error("Unexpected error processing prices: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-def _validate_date(date_str: str) -> datetime.date:
+def _columnar_day(day_prices: DayPrices) -> Dict:
+    """Column-oriented layout for binary consumers: parallel arrays instead of
+    one object per hour, so numeric columns pack compactly in MessagePack"""
+    hours = day_prices.hours
+    return {
+        "date": day_prices.date,
+        "ts": [h.timestamp_ms for h in hours],
+        "hour": [h.hour_label for h in hours],
+        "eur": [h.price_eur_mwh for h in hours],
+        "ct": [h.price_ct_kwh for h in hours],
+        # bit 0 = is_missing, bit 1 = is_dst_transition
+        "flags": [(1 if h.is_missing else 0) | (2 if h.is_dst_transition else 0) for h in hours],
+    }
+
+
+def _msgpack_response(result: PricesResponse) -> Response:
+    payload = {
+        "previous_day": _columnar_day(result.previous_day),
+        "selected_day": _columnar_day(result.selected_day),
+        "next_day": _columnar_day(result.next_day),
+        "metadata": result.metadata,
+    }
+    return Response(
+        content=ormsgpack.packb(payload),
+        media_type="application/msgpack"
+    )
+
+
+# "Today" in Vienna, refreshed at most once a minute — cheap enough to be
+# exact for range validation without a tz-aware now() per request
+_today_cache: Tuple[float, Optional[date]] = (0.0, None)
+
+
+def _today_vienna() -> date:
+    global _today_cache
+    now = time.monotonic()
+    cached_at, today = _today_cache
+    if today is None or now - cached_at > 60.0:
+        today = datetime.now(settings.VIENNA_TZ).date()
+        _today_cache = (now, today)
+    return today
+
+
+def _validate_date(date_str: str) -> date:
     """Validate date format and range"""
     try:
-        parsed_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        
+        # The route pattern already guarantees the YYYY-MM-DD shape, so slice
+        # the digits directly instead of walking strptime's format machinery
+        parsed_date = date(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
+
         # Validate date range (e.g., not too far in future/past)
-        today = datetime.now(settings.VIENNA_TZ).date()
+        today = _today_vienna()
         max_future = today + timedelta(days=365)
         min_past = today - timedelta(days=365)
         
@@ -117,51 +224,101 @@ async def _process_three_days(
     dates: Dict[str, datetime.date],
     raw_data: list,
     include_metadata: bool
-) -> PricesResponse:
-    """Process data for all three days"""
+) -> Tuple[PricesResponse, Dict]:
+    """Process data for all three days.
+
+    Returns (response, expected_hour_counts) — the grid builder reports how
+    many hours each day should have, so validation needs no second DST scan."""
     
-    # Separate data by day
+    # Separate data by day using precomputed day boundaries (ms since epoch),
+    # so bucketing is an integer compare instead of a tz conversion per entry
+    vienna_tz = settings.VIENNA_TZ
+    prev_ms, sel_ms, next_ms, next_next_ms = (
+        int(datetime.combine(d, datetime.min.time()).replace(tzinfo=vienna_tz).timestamp() * 1000)
+        for d in (
+            dates["previous"],
+            dates["selected"],
+            dates["next"],
+            dates["next"] + timedelta(days=1)
+        )
+    )
+
     day_data = {"previous": [], "selected": [], "next": []}
-    
+    # Prices bucketed by hour offset from each day start, so the grid builder
+    # can index instead of hashing the same raw_data three times over
+    max_hours = settings.MAX_HOURS_PER_DAY
+    price_arrays = {key: [None] * max_hours for key in day_data}
+
     for entry in raw_data:
-        entry_dt = datetime.fromtimestamp(
-            entry["start_timestamp"] / 1000,
-            tz=settings.VIENNA_TZ
-        )
-        entry_date = entry_dt.date()
-        
-        if entry_date == dates["previous"]:
-            day_data["previous"].append(entry)
-        elif entry_date == dates["selected"]:
-            day_data["selected"].append(entry)
-        elif entry_date == dates["next"]:
-            day_data["next"].append(entry)
+        ts = entry["start_timestamp"]
+        if ts < prev_ms:
+            continue
+        elif ts < sel_ms:
+            day_key, day_start_ms = "previous", prev_ms
+        elif ts < next_ms:
+            day_key, day_start_ms = "selected", sel_ms
+        elif ts < next_next_ms:
+            day_key, day_start_ms = "next", next_ms
+        else:
+            continue
+
+        day_data[day_key].append(entry)
+        # Only hour-aligned entries may claim an array slot: a sub-hourly
+        # timestamp (e.g. 00:15 under a 15-minute MTU) must read as missing,
+        # exactly like the exact-match dict lookup it replaced, not silently
+        # overwrite the real price for that hour
+        idx, remainder = divmod(ts - day_start_ms, 3_600_000)
+        if remainder == 0 and 0 <= idx < max_hours:
+            price_arrays[day_key][idx] = entry["marketprice"]
     
     # Debug: Log data points per day
-    logger.debug(f"Data points - Previous: {len(day_data['previous'])}, "
-                f"Selected: {len(day_data['selected'])}, "
-                f"Next: {len(day_data['next'])}")
+    logger.debug("Data points - Previous: %d, Selected: %d, Next: %d",
+                len(day_data["previous"]), len(day_data["selected"]), len(day_data["next"]))
     
-    # Create hourly grids
-    days_result = {}
-    for day_key, day_date in dates.items():
-        day_start = datetime.combine(day_date, datetime.min.time()).replace(
+    # Create hourly grids — optionally in parallel worker threads
+    day_starts = {
+        day_key: datetime.combine(day_date, datetime.min.time()).replace(
             tzinfo=settings.VIENNA_TZ
         )
-        
-        hours, has_dst = service.create_hourly_grid(
-            day_start,
-            day_data[day_key]
-        )
-        
+        for day_key, day_date in dates.items()
+    }
+
+    if settings.PARALLEL_GRID_BUILD:
+        grids = await asyncio.gather(*(
+            asyncio.to_thread(
+                service.create_hourly_grid,
+                day_starts[day_key],
+                day_data[day_key],
+                price_arrays[day_key]
+            )
+            for day_key in dates
+        ))
+        grid_results = dict(zip(dates, grids))
+    else:
+        grid_results = {
+            day_key: service.create_hourly_grid(
+                day_starts[day_key], day_data[day_key], price_arrays[day_key]
+            )
+            for day_key in dates
+        }
+
+    days_result = {}
+    expected_counts = {}
+    for day_key, day_date in dates.items():
+        hours, has_dst, expected_counts[day_key] = grid_results[day_key]
+
         # Debug: Print hours being processed
-        logger.debug(f"{day_key.upper()} ({day_date}): {len(hours)} hours generated, DST: {has_dst}")
-        logger.debug(f"  First hour: {hours[0].hour_label if hours else 'N/A'}")
-        logger.debug(f"  Last hour: {hours[-1].hour_label if hours else 'N/A'}")
-        
+        logger.debug("%s (%s): %d hours generated, DST: %s", day_key.upper(), day_date, len(hours), has_dst)
+        logger.debug("  First hour: %s", hours[0].hour_label if hours else "N/A")
+        logger.debug("  Last hour: %s", hours[-1].hour_label if hours else "N/A")
+
         days_result[day_key] = DayPrices(
             date=day_date.isoformat(),
-            hours=hours
+            # The service works with plain named tuples; adapt to the Pydantic
+            # model only here, at the serialization boundary
+            hours=[HourlyPrice.model_construct(**h._asdict()) for h in hours],
+            total_hours=len(hours),
+            missing_hours=sum(1 for h in hours if h.is_missing)
         )
     
     # Build response
@@ -184,21 +341,23 @@ async def _process_three_days(
             }
         }
     
-    return response
+    return response, expected_counts
 
 
-def _validate_hour_counts(response: PricesResponse, dates: Dict[str, datetime.date]):
+def _validate_hour_counts(
+    response: PricesResponse,
+    dates: Dict[str, datetime.date],
+    expected_counts: Dict[str, int]
+):
     """Validate that each day has the correct number of hours"""
-    service = PriceService()
-    
     validations = [
-        ("previous_day", dates["previous"], response.previous_day),
-        ("selected_day", dates["selected"], response.selected_day),
-        ("next_day", dates["next"], response.next_day)
+        ("previous_day", "previous", dates["previous"], response.previous_day),
+        ("selected_day", "selected", dates["selected"], response.selected_day),
+        ("next_day", "next", dates["next"], response.next_day)
     ]
-    
-    for day_name, day_date, day_prices in validations:
-        expected_hours = service._get_expected_hour_count(day_date)
+
+    for day_name, day_key, day_date, day_prices in validations:
+        expected_hours = expected_counts[day_key]
         actual_hours = len(day_prices.hours)
         
         if actual_hours != expected_hours:
@@ -209,10 +368,11 @@ def _validate_hour_counts(response: PricesResponse, dates: Dict[str, datetime.da
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        logger.info(f"{day_name} ({day_date}): ✓ {actual_hours} hours (correct)")
+        logger.info("%s (%s): ✓ %d hours (correct)", day_name, day_date, actual_hours)
 
 @router.get("/{date}/export-csv")
 async def export_prices_csv(
+    request: Request,
     date: str = Path(
         ...,
         description="Date in YYYY-MM-DD format",
@@ -224,56 +384,29 @@ async def export_prices_csv(
     Matches the data structure of the main GET endpoint.
     """
     selected_date = _validate_date(date)
-    date_range = _calculate_date_range(selected_date)
-    
-    service = PriceService()
-    raw_data = await service.fetch_market_data(
-        date_range["start_ts"],
-        date_range["end_ts"]
-    )
-    
-    result = await _process_three_days(
-        service, 
-        date_range["dates"], 
-        raw_data,
-        include_metadata=False
-    )
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow([
-        "date", 
-        "hour", 
-        "price_eur_mwh", 
-        "price_ct_kwh",
-        "is_missing",
-        "is_dst_transition"
-    ])
-    
-    # Helper to write day data
-    def write_day_data(day_prices: DayPrices):
-        for hour in day_prices.hours:
-            writer.writerow([
-                day_prices.date,  # ISO format date string (e.g., "2025-10-25")
-                hour.hour_label,
-                hour.price_eur_mwh if hour.price_eur_mwh is not None else "",
-                hour.price_ct_kwh if hour.price_ct_kwh is not None else "",
-                hour.is_missing,
-                hour.is_dst_transition
-            ])
-    
-    # Write all three days in order: previous → selected → next
-    write_day_data(result.previous_day)
-    write_day_data(result.selected_day)
-    write_day_data(result.next_day)
-    
-    output.seek(0)
-    
+
+    service = PriceService(_shared_http_client(request))
+    result, _, _ = await _build_response(service, selected_date, include_metadata=False)
+
+    # Stream CSV row-by-row instead of buffering the whole file in memory.
+    # Every column is a date, HH:MM label, number or boolean — nothing ever
+    # needs quoting — so plain f-strings beat csv.writer's quote-checking.
+    def row_iter():
+        yield b"date,hour,price_eur_mwh,price_ct_kwh,is_missing,is_dst_transition\r\n"
+
+        # Write all three days in order: previous → selected → next
+        for day_prices in (result.previous_day, result.selected_day, result.next_day):
+            day = day_prices.date  # ISO format date string (e.g., "2025-10-25")
+            for hour in day_prices.hours:
+                yield (
+                    f"{day},{hour.hour_label},"
+                    f"{'' if hour.price_eur_mwh is None else hour.price_eur_mwh},"
+                    f"{'' if hour.price_ct_kwh is None else hour.price_ct_kwh},"
+                    f"{hour.is_missing},{hour.is_dst_transition}\r\n"
+                ).encode("utf-8")
+
     return StreamingResponse(
-        iter([output.getvalue()]),
+        row_iter(),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=electricity_prices_{date}_three_days.csv"
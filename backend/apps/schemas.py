@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class HourlyPrice(BaseModel):
@@ -9,7 +9,10 @@ class HourlyPrice(BaseModel):
     price_ct_kwh: Optional[float] = Field(None, ge=-100, le=1000)
     is_missing: bool = False
     is_dst_transition: bool = False
-    
+    # Local UTC offset at this hour; lets consumers derive the local hour with
+    # integer math instead of a tz-aware datetime round-trip per row
+    utc_offset_seconds: int = 0
+
     class Config:
         json_schema_extra = {
             "example": {
@@ -18,23 +21,18 @@ class HourlyPrice(BaseModel):
                 "price_eur_mwh": 85.5,
                 "price_ct_kwh": 8.55,
                 "is_missing": False,
-                "is_dst_transition": False
+                "is_dst_transition": False,
+                "utc_offset_seconds": 7200
             }
         }
 
 class DayPrices(BaseModel):
     date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
     hours: List[HourlyPrice]
-
-    @computed_field
-    @property
-    def total_hours(self) -> int:
-        return len(self.hours)
-
-    @computed_field
-    @property
-    def missing_hours(self) -> int:
-        return sum(1 for h in self.hours if h.is_missing)
+    # Computed once when the day is built; re-deriving on every serialization
+    # would cost an extra pass over hours per response
+    total_hours: int = 0
+    missing_hours: int = 0
 
 class PricesResponse(BaseModel):
     """Complete 3-day price response"""
@@ -1,23 +1,183 @@
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+import asyncio
+import bisect
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import ClassVar, List, Dict, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
 import httpx
-from apps.schemas import HourlyPrice
 from config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bind hot-path constants once at import; settings are frozen, so chasing the
+# settings attribute chain per hour buys nothing. Multiplying by the inverse
+# factor also avoids a division per price.
+_VIENNA = settings.VIENNA_TZ
+_INV_CONVERSION_FACTOR = 1.0 / settings.CONVERSION_FACTOR
+
+# In-process cache for upstream market data, shared across PriceService
+# instances. Day-ahead prices don't change after publication, so a short
+# TTL is safe and collapses the JSON-then-CSV double fetch per date.
+# Bounded like the router's response cache: stale entries are swept on
+# insert and the oldest evicted past the cap.
+_MARKET_DATA_TTL = 300.0
+_MARKET_DATA_CACHE_MAX = 16
+_market_data_cache: Dict[Tuple[int, int], Tuple[float, List[Dict]]] = {}
+_market_data_inflight: Dict[Tuple[int, int], "asyncio.Future[List[Dict]]"] = {}
+
+
+def _cache_market_data(key: Tuple[int, int], data: List[Dict]) -> None:
+    now = time.monotonic()
+    _market_data_cache[key] = (now, data)
+    for stale in [k for k, v in _market_data_cache.items() if now - v[0] >= _MARKET_DATA_TTL]:
+        del _market_data_cache[stale]
+    while len(_market_data_cache) > _MARKET_DATA_CACHE_MAX:
+        del _market_data_cache[next(iter(_market_data_cache))]
+
+# The grid is strictly hourly, so all labels come from this table; only the
+# ambiguous October hour gets an A/B suffix appended. Keeping the suffixed
+# variants as constants too means every row shares one of ≤26 interned str
+# objects instead of allocating its own label
+_HOUR_LABELS = tuple(f"{h:02d}:00" for h in range(24))
+_LABEL_02A = "02:00A"
+_LABEL_02B = "02:00B"
+
+
+class _Hour(NamedTuple):
+    """Lightweight per-hour record used inside the service; converted to the
+    Pydantic HourlyPrice model only at the response boundary"""
+    timestamp_ms: int
+    hour_label: str
+    price_eur_mwh: Optional[float]
+    price_ct_kwh: Optional[float]
+    is_missing: bool
+    is_dst_transition: bool
+    utc_offset_seconds: int
+
+# Precomputed DST transition instants for Europe/Vienna so hot paths can
+# resolve a UTC offset with one bisect instead of a zoneinfo lookup per call.
+# Each transition happens at 01:00 UTC on the last Sunday of March (to CEST,
+# UTC+2) and October (to CET, UTC+1); verified against zoneinfo when built.
+_CET_MS = 3_600_000
+_CEST_MS = 7_200_000
+
+def _last_sunday(year: int, month: int) -> date:
+    last_day = date(year, month, 31)
+    return last_day - timedelta(days=(last_day.weekday() + 1) % 7)
+
+# Every 23h/25h date for the era in which the current EU rule (last Sunday
+# of March / last Sunday of October) is exact for Europe/Vienna. Lookup is
+# one frozenset hash instead of any tz computation; years outside the built
+# range (pre-1996 rules differed; the table stops at 2099) go through the
+# scanned per-year cache instead.
+_EU_RULE_FIRST_YEAR = 1996
+_EU_RULE_TABLE_END = 2100  # exclusive
+_SHORT_DAYS = frozenset(_last_sunday(y, 3) for y in range(_EU_RULE_FIRST_YEAR, _EU_RULE_TABLE_END))
+_LONG_DAYS = frozenset(_last_sunday(y, 10) for y in range(_EU_RULE_FIRST_YEAR, _EU_RULE_TABLE_END))
+
+def _build_vienna_transitions(first_year: int, last_year: int):
+    transitions = []  # (utc_instant_ms, offset_ms in force from that instant)
+    for year in range(first_year, last_year + 1):
+        for month, offset_after in ((3, _CEST_MS), (10, _CET_MS)):
+            last_sunday = _last_sunday(year, month)
+            instant = datetime(
+                last_sunday.year, last_sunday.month, last_sunday.day, 1,
+                tzinfo=timezone.utc
+            )
+            after = _VIENNA.utcoffset(instant.astimezone(_VIENNA))
+            if int(after.total_seconds() * 1000) != offset_after:
+                # This table is the sole guard on offset correctness, so fail
+                # loudly (not assert — stripped under -O) if tzdata ever
+                # diverges from the EU rule, e.g. should the EU drop DST
+                raise RuntimeError(
+                    f"Europe/Vienna offset mismatch at {year}-{month:02d}: "
+                    f"expected {offset_after} ms after transition, tzdata says "
+                    f"{int(after.total_seconds() * 1000)} ms"
+                )
+            transitions.append((int(instant.timestamp() * 1000), offset_after))
+    return transitions
+
+_THIS_YEAR = datetime.now(timezone.utc).year
+_VIENNA_TRANSITIONS = _build_vienna_transitions(_THIS_YEAR - 2, _THIS_YEAR + 2)
+_VIENNA_TRANS_MS = [t[0] for t in _VIENNA_TRANSITIONS]
+_VIENNA_OFFSETS_MS = [t[1] for t in _VIENNA_TRANSITIONS]
+_TABLE_START_MS = int(datetime(_THIS_YEAR - 2, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+_TABLE_END_MS = int(datetime(_THIS_YEAR + 3, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+def vienna_offset_ms(ts_ms: int) -> int:
+    """UTC offset of Europe/Vienna at a UTC instant, in milliseconds"""
+    if not _TABLE_START_MS <= ts_ms < _TABLE_END_MS:
+        # Outside the precomputed window (requests are clamped to ±1 year,
+        # so this is effectively cold): fall back to zoneinfo
+        dt = datetime.fromtimestamp(ts_ms / 1000, tz=_VIENNA)
+        return int(dt.utcoffset().total_seconds() * 1000)
+
+    i = bisect.bisect_right(_VIENNA_TRANS_MS, ts_ms)
+    return _VIENNA_OFFSETS_MS[i - 1] if i else _CET_MS
+
 class PriceService:
     """Handles electricity price business logic"""
-    
+
+    # The single process-wide tz instance; tests and callers should reference
+    # this rather than constructing their own ZoneInfo("Europe/Vienna")
+    TZ: ClassVar[ZoneInfo] = _VIENNA
+
+    # Per-(timezone key, year) table of dates whose day length differs from
+    # 24 hours, e.g. {date(2025, 3, 30): 23, date(2025, 10, 26): 25}
+    _dst_cache: ClassVar[Dict[Tuple[str, int], Dict[date, int]]] = {}
+
     def __init__(self, api_client: httpx.AsyncClient = None):
         self.api_client = api_client or httpx.AsyncClient(
             timeout=settings.API_TIMEOUT
         )
-        self.vienna_tz = settings.VIENNA_TZ
-    
+        self.vienna_tz = self.TZ
+
     async def fetch_market_data(self, start_ts: int, end_ts: int) -> List[Dict]:
-        """Fetch raw data from aWATTar API with retry logic"""
+        """Fetch raw data from aWATTar API, with a TTL cache and de-duplication
+        of concurrent identical requests (singleflight)"""
+        key = (start_ts, end_ts)
+
+        cached = _market_data_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < _MARKET_DATA_TTL:
+            return cached[1]
+
+        inflight = _market_data_inflight.get(key)
+        if inflight is not None:
+            try:
+                # shield: our own cancellation must not cancel the shared
+                # future out from under the other waiters
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The owner's request was cancelled (client disconnect) before
+                # it could resolve the shared future. If we weren't cancelled
+                # ourselves, fetch directly instead of inheriting its fate.
+                if not inflight.cancelled():
+                    raise
+                data = await self._fetch_market_data_upstream(start_ts, end_ts)
+                _cache_market_data(key, data)
+                return data
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        _market_data_inflight[key] = future
+        try:
+            data = await self._fetch_market_data_upstream(start_ts, end_ts)
+            _cache_market_data(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved; we re-raise to our own caller
+            raise
+        finally:
+            # CancelledError bypasses the except above (it's a BaseException);
+            # cancel the future so concurrent waiters don't hang forever
+            if not future.done():
+                future.cancel()
+            _market_data_inflight.pop(key, None)
+
+    async def _fetch_market_data_upstream(self, start_ts: int, end_ts: int) -> List[Dict]:
+        """Issue the actual aWATTar API request"""
         try:
             response = await self.api_client.get(
                 settings.API_URL,
@@ -29,14 +189,71 @@ class PriceService:
         except httpx.HTTPError as e:
             raise PriceServiceError(f"API fetch failed: {str(e)}") from e
     
-    def create_hourly_grid(self, date: datetime, raw_data: List[Dict]) -> Tuple[List[HourlyPrice], bool]:
+    def create_hourly_grid(
+        self,
+        date: datetime,
+        raw_data: List[Dict],
+        price_array: Optional[List[Optional[float]]] = None,
+        *,
+        tz_offsets: Optional[Tuple[int, int]] = None
+    ) -> Tuple[List[_Hour], bool, int]:
         target_date = date.date() if isinstance(date, datetime) else date
-        
+
         day_start = datetime(target_date.year, target_date.month, target_date.day, 0, 0, tzinfo=self.vienna_tz)
         day_end = day_start + timedelta(days=1)
+        day_start_ts_ms = int(day_start.timestamp() * 1000)
+
+        if price_array is not None:
+            # Caller pre-bucketed prices by hour offset from day start (see
+            # _process_three_days): O(1) list indexing, no per-call hashing
+            array_len = len(price_array)
+
+            def get_price(ts_ms: int) -> Optional[float]:
+                idx = (ts_ms - day_start_ts_ms) // 3_600_000
+                return price_array[idx] if 0 <= idx < array_len else None
+        else:
+            price_map = {entry["start_timestamp"]: entry["marketprice"] for entry in raw_data}
+            get_price = price_map.get
+
+        # Fast path: if the UTC offset is the same at both ends of the day there
+        # is no DST transition inside it (Vienna never has two in one day), so
+        # the 24 hourly timestamps follow by pure integer arithmetic — no
+        # per-hour datetime allocation or utcoffset() lookup needed. Callers
+        # that already know the day's start/end offsets (in seconds) can pass
+        # them via tz_offsets and skip the table lookups entirely.
+        day_start_ms = day_start_ts_ms
+        if tz_offsets is not None:
+            start_offset_s, end_offset_s = tz_offsets
+        else:
+            start_offset_s = vienna_offset_ms(day_start_ms) // 1000
+            end_offset_s = vienna_offset_ms(day_start_ms + 86_400_000) // 1000
+        if start_offset_s == end_offset_s:
+            # Convert the whole day's prices in one batch pass rather than a
+            # method call per hour
+            day_offset_s = start_offset_s
+            eur_prices = [get_price(day_start_ms + i * 3_600_000) for i in range(24)]
+            ct_prices = [None if p is None else round(p * _INV_CONVERSION_FACTOR, 2) for p in eur_prices]
+
+            hourly_prices = []
+            for i in range(24):
+                price_eur_mwh = eur_prices[i]
+                label = _HOUR_LABELS[i]
+                if target_date.month == 10 and i == 2:
+                    label = _LABEL_02A  # keep _format_hour_label's October notation
+
+                hourly_prices.append(_Hour(
+                    timestamp_ms=day_start_ms + i * 3_600_000,
+                    hour_label=label,
+                    price_eur_mwh=price_eur_mwh,
+                    price_ct_kwh=ct_prices[i],
+                    is_missing=(price_eur_mwh is None),
+                    is_dst_transition=False,
+                    utc_offset_seconds=day_offset_s
+                ))
+
+            logger.debug("Generated %d hours for %s, DST transition: False", len(hourly_prices), target_date)
+            return hourly_prices, False, self._get_expected_hour_count(target_date)
 
-        price_map = {entry["start_timestamp"]: entry["marketprice"] for entry in raw_data}
-        
         hourly_prices = []
         has_dst_transition = False
         seen_timestamps = set()
@@ -50,7 +267,7 @@ class PriceService:
 
             # Handle SPRING-FORWARD (non-existent hour): skip if timestamps are equal
             if timestamp_ms == next_timestamp_ms:
-                logger.debug(f"Skipping non-existent hour during spring forward: {current_time}")
+                logger.debug("Skipping non-existent hour during spring forward: %s", current_time)
                 has_dst_transition = True
                 # Don't add to seen_timestamps - we haven't processed this hour!
                 # Just move to the next hour
@@ -69,15 +286,16 @@ class PriceService:
             if is_dst_transition:
                 has_dst_transition = True
 
-            price_eur_mwh = price_map.get(timestamp_ms)
+            price_eur_mwh = get_price(timestamp_ms)
 
-            hourly_prices.append(HourlyPrice(
+            hourly_prices.append(_Hour(
                 timestamp_ms=timestamp_ms,
                 hour_label=self._format_hour_label(current_time),
                 price_eur_mwh=price_eur_mwh,
                 price_ct_kwh=self._convert_to_ct_kwh(price_eur_mwh) if price_eur_mwh is not None else None,
                 is_missing=(price_eur_mwh is None),
-                is_dst_transition=is_dst_transition
+                is_dst_transition=is_dst_transition,
+                utc_offset_seconds=int(current_time.utcoffset().total_seconds())
             ))
 
             # CRITICAL: Handle fall-back duplicated hour
@@ -96,35 +314,81 @@ class PriceService:
                     # If fold=1 creates a different timestamp, add it
                     if current_fold1_ms != timestamp_ms and current_fold1_ms not in seen_timestamps:
                         seen_timestamps.add(current_fold1_ms)
-                        price_eur_mwh_fold1 = price_map.get(current_fold1_ms)
+                        price_eur_mwh_fold1 = get_price(current_fold1_ms)
                         
-                        hourly_prices.append(HourlyPrice(
+                        hourly_prices.append(_Hour(
                             timestamp_ms=current_fold1_ms,
                             hour_label=self._format_hour_label(current_fold1),
                             price_eur_mwh=price_eur_mwh_fold1,
                             price_ct_kwh=self._convert_to_ct_kwh(price_eur_mwh_fold1) if price_eur_mwh_fold1 is not None else None,
                             is_missing=(price_eur_mwh_fold1 is None),
-                            is_dst_transition=False
+                            is_dst_transition=False,
+                            utc_offset_seconds=int(current_fold1.utcoffset().total_seconds())
                         ))
-                        logger.debug(f"Added duplicate hour: {current_time.hour}:00 (fold=1)")
+                        logger.debug("Added duplicate hour: %d:00 (fold=1)", current_time.hour)
                 except Exception as e:
-                    logger.debug(f"No fold=1 for current hour: {e}")
+                    logger.debug("No fold=1 for current hour: %s", e)
 
             current_time = next_time
 
-        logger.debug(f"Generated {len(hourly_prices)} hours for {target_date}, DST transition: {has_dst_transition}")
-        return hourly_prices, has_dst_transition
+        logger.debug("Generated %d hours for %s, DST transition: %s", len(hourly_prices), target_date, has_dst_transition)
+        return hourly_prices, has_dst_transition, self._get_expected_hour_count(target_date)
     
     def _get_expected_hour_count(self, target_date) -> int:
         """
         Calculate expected number of hours for a given date.
-        
+
         - Normal day: 24 hours
         - DST start (spring forward): 23 hours (March, last Sunday)
         - DST end (fall back): 25 hours (October, last Sunday)
-        
-        This method actually counts hours that exist, accounting for DST gaps/overlaps.
+
+        Dates in 1996–2099 resolve through the precomputed EU-rule frozensets
+        with no tz work at all; years outside that table — pre-1996 rules
+        differed (e.g. Vienna fell back in September until 1995) and the
+        frozensets stop at 2099 — fall back to a per-(timezone, year) table
+        built by scanning the whole year.
         """
+        if _EU_RULE_FIRST_YEAR <= target_date.year < _EU_RULE_TABLE_END:
+            # Only March and October can hold a transition in the EU-rule era
+            if target_date.month not in (3, 10):
+                return 24
+            if target_date in _SHORT_DAYS:
+                return 23
+            if target_date in _LONG_DAYS:
+                return 25
+            return 24
+
+        key = (self.vienna_tz.key, target_date.year)
+        year_map = self._dst_cache.get(key)
+        if year_map is None:
+            year_map = self._build_dst_year_map(target_date.year)
+            self._dst_cache[key] = year_map
+
+        return year_map.get(target_date, 24)
+
+    def _build_dst_year_map(self, year: int) -> Dict[date, int]:
+        """Map of the dates in a year whose local day is not 24 hours long.
+
+        Scans every day of the year: historical rules put transitions outside
+        March/October (Vienna fell back in September until 1995). This is a
+        cached cold path, so the full scan costs nothing per request."""
+        year_map = {}
+        day = date(year, 1, 1)
+        while day.year == year:
+            count = self._scan_hour_count(day)
+            if count != 24:
+                year_map[day] = count
+            day += timedelta(days=1)
+        return year_map
+
+    @classmethod
+    def clear_cache(cls):
+        """Drop the cached DST tables (useful when tests swap tz data)"""
+        cls._dst_cache.clear()
+
+    def _scan_hour_count(self, target_date) -> int:
+        """Count the hours that actually exist on a date, walking the day
+        hour-by-hour and accounting for DST gaps/overlaps"""
         day_start = datetime(target_date.year, target_date.month, target_date.day, 0, 0, tzinfo=self.vienna_tz)
         next_day_date = target_date + timedelta(days=1)
         day_end = datetime(next_day_date.year, next_day_date.month, next_day_date.day, 0, 0, tzinfo=self.vienna_tz)
@@ -174,24 +438,24 @@ class PriceService:
                     pass
             
             current_time = next_time
-        
+
         return hour_count
     
     def _format_hour_label(self, dt: datetime) -> str:
         """Format hour label, handling the 2A/2B notation for October DST transition"""
-        base_label = dt.strftime("%H:%M")
-        
+        base_label = _HOUR_LABELS[dt.hour]  # grid datetimes are always on the hour
+
         # In Europe, the 'fall back' happens in October at 3:00 -> 2:00
         # The hour 02:00-03:00 occurs twice
         # 'fold=0' is the first occurrence (CEST), 'fold=1' is the second (CET)
         if dt.month == 10 and dt.hour == 2:
-            return f"{base_label}A" if dt.fold == 0 else f"{base_label}B"
+            return _LABEL_02A if dt.fold == 0 else _LABEL_02B
         
         return base_label
     
     def _convert_to_ct_kwh(self, price_eur_mwh: float) -> float:
         """Convert EUR/MWh to ct/kWh"""
-        return round(price_eur_mwh / settings.CONVERSION_FACTOR, 2)
+        return round(price_eur_mwh * _INV_CONVERSION_FACTOR, 2)
 
 
 class PriceServiceError(Exception):
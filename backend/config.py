@@ -10,6 +10,10 @@ class Settings:
     CONVERSION_FACTOR: float = 10.0  # EUR/MWh to ct/kWh
     MAX_HOURS_PER_DAY: int = 26
     API_TIMEOUT: float = 30.0
+    # Build the three daily grids in worker threads via asyncio.gather.
+    # Off by default: the grids are CPU-only today and thread handoff can
+    # cost more than it saves; flip on if grid building grows I/O.
+    PARALLEL_GRID_BUILD: bool = False
     CORS_ORIGINS: List[str] = field(default_factory=lambda: ["http://localhost:3000", "http://localhost:5173"])
 
 settings = Settings()
\ No newline at end of file
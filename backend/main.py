@@ -1,14 +1,27 @@
 
 import datetime
+from contextlib import asynccontextmanager
+import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from apps.routers import prices
 from config import settings
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create one app-lifetime HTTP client so upstream connections are reused"""
+    app.state.http_client = httpx.AsyncClient(
+        timeout=settings.API_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+    yield
+    await app.state.http_client.aclose()
+
 app = FastAPI(
     title="Austrian Electricity Prices API",
     description="API for retrieving day-ahead electricity prices from aWATTar",
     version="1.0.0",
+    lifespan=lifespan,
     contact={
         "name": "API Support",
         "email": "support@example.com"
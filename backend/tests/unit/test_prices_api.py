@@ -0,0 +1,65 @@
+import ormsgpack
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+from apps.routers import prices as prices_router
+from apps.services.prices import PriceService, _last_sunday
+
+# The current year's fall-back date (last Sunday of October), derived at
+# import so the test never ages out of the validator's ±1 year window; the
+# selected day then has 25 hours and a DST-flagged row
+_FALL_BACK = _last_sunday(datetime.now(PriceService.TZ).year, 10)
+FALL_BACK_DATE = _FALL_BACK.isoformat()
+
+# First occurrence of 02:00 local on the fall-back day — the hour
+# create_hourly_grid marks as the DST transition. Under CEST (UTC+2) that
+# instant is midnight UTC on the same date.
+_DST_HOUR_MS = int(
+    datetime(_FALL_BACK.year, _FALL_BACK.month, _FALL_BACK.day, 0, 0, tzinfo=timezone.utc).timestamp() * 1000
+)
+
+
+@pytest.fixture
+def market_data_stub():
+    """Serve a full hourly series for any requested range, minus one selected-day
+    hour so the missing flag is exercised"""
+    def mk(start_ts, end_ts):
+        return [
+            {"start_timestamp": t, "marketprice": 50.0}
+            for t in range(start_ts, end_ts, 3_600_000)
+            if t != _DST_HOUR_MS + 3_600_000
+        ]
+
+    prices_router._response_cache.clear()
+    with patch.object(PriceService, "fetch_market_data", new=AsyncMock(side_effect=mk)):
+        yield
+    prices_router._response_cache.clear()
+
+
+class TestMsgpackFormat:
+    """Wire-level checks for the columnar msgpack encoding"""
+
+    def test_columnar_payload_for_dst_date(self, client, market_data_stub):
+        response = client.get(f"/api/prices/{FALL_BACK_DATE}?format=msgpack")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+
+        payload = ormsgpack.unpackb(response.content)
+        assert set(payload) == {"previous_day", "selected_day", "next_day", "metadata"}
+
+        # Parallel arrays must stay in lockstep, with the 25-hour fall-back day
+        for day_key, expected_len in (("previous_day", 24), ("selected_day", 25), ("next_day", 24)):
+            day = payload[day_key]
+            for column in ("ts", "hour", "eur", "ct"):
+                assert len(day[column]) == expected_len, (day_key, column)
+            assert len(day["flags"]) == expected_len, day_key
+
+        # bit 0 = is_missing, bit 1 = is_dst_transition
+        flags = payload["selected_day"]["flags"]
+        hours = payload["selected_day"]["hour"]
+        assert sum(1 for f in flags if f & 2) == 1
+        assert hours[flags.index(2)] == "02:00A"
+        missing_idx = [i for i, f in enumerate(flags) if f & 1]
+        assert len(missing_idx) == 1
+        assert payload["selected_day"]["eur"][missing_idx[0]] is None